@@ -11,14 +11,34 @@ Licensed under the MIT license. See the "license" file for details.
 import argparse
 import os
 import sys
-import re
+import io
+import mmap
+import stat
+import threading
+import queue
+import itertools
+import contextlib
 import converters
 
 VERSION = "1.1.0"
 
+# The number of bytes read from an input file and passed to a converter at a time, unless --block-size is given
+DEFAULT_BLOCK_SIZE = 1 << 20
+# Converted data smaller than this is collected and written to the output in one call
+OUTPUT_BUFFER_SIZE = 1 << 16
+# Directory mode only starts worker threads when at least this many files match
+MIN_THREADED_FILES = 4
+# The most matching files that are waiting to be converted in directory mode at any time
+DIRECTORY_QUEUE_SIZE = 64
 
+# The registry does not change after import, so the choices are taken from it once
+SOURCE_FORMATS = converters.source_formats
+OUTPUT_FORMATS = converters.output_formats
+CONVERTER_NAMES = converters.converter_names
+WARNING_TREATMENTS = ("display", "ignore", "error")
 
-def convert_file(inf, outf, converter, warnings="display", warning_table=[]):
+
+def convert_file(inf, outf, converter, warnings="display", warning_table=(), block_size=DEFAULT_BLOCK_SIZE, message_lock=None):
     """
     Convert a file using a provided converter instance.
 
@@ -26,7 +46,12 @@ def convert_file(inf, outf, converter, warnings="display", warning_table=[]):
         inf: The input file stream, opened for read in binary mode.
         outf: The output file stream, opened for write or append in binary mode.
         converter: The converter instance that converts strings from one format to another.
+        block_size: The number of bytes read from the input file and passed to the converter at a time.
+        message_lock: A lock held while warnings are written, when several files are converted at the same time.
     """
+    if message_lock is None:
+        message_lock = contextlib.nullcontext()
+
     def handle_warnings(warnings, default_warning_treatment, warning_table):
         for w in converter.warnings:
             treatment = default_warning_treatment
@@ -43,16 +68,91 @@ def convert_file(inf, outf, converter, warnings="display", warning_table=[]):
                     sys.stderr.write("Above warning treated as error.\n")
                     sys.exit(-2)
 
-    for line in inf:
-        outf.write(converter.convert_string(line))
-        handle_warnings(converter.warnings, warnings, warning_table)
-        converter.clear_warnings()
-    outf.write(converter.close())
-    handle_warnings(converter.warnings, warnings, warning_table)
-    converter.clear_warnings()
+    # When every warning would be ignored, they are only cleared and never inspected
+    ignore_all_warnings = (warnings == "ignore" and len(warning_table) == 0)
+
+    def flush_warnings():
+        if converter.warnings:
+            if not ignore_all_warnings:
+                # A warning and any line saying it was treated as an error are written together
+                with message_lock:
+                    handle_warnings(converter.warnings, warnings, warning_table)
+            converter.clear_warnings()
+
+    pending_output = bytearray()
+
+    def write_output(data):
+        if not data:
+            return
+        if pending_output or len(data) < OUTPUT_BUFFER_SIZE:
+            pending_output.extend(data)
+            if len(pending_output) >= OUTPUT_BUFFER_SIZE:
+                outf.write(pending_output)
+                pending_output.clear()
+        else:
+            outf.write(data)
+
+    # The file is converted in fixed-size blocks rather than lines
+    # A block ending in \r is held back by one byte so that a \r\n line break is never split between blocks
+    tail = b""
+    for block in read_blocks(inf, block_size):
+        block = tail + block
+        if block.endswith(b"\r"):
+            block, tail = block[:-1], b"\r"
+        else:
+            tail = b""
+        if block:
+            write_output(converter.convert_string(block))
+        flush_warnings()
+    if tail:
+        write_output(converter.convert_string(tail))
+        flush_warnings()
+    write_output(converter.close())
+    outf.write(pending_output)
+    flush_warnings()
+
+
+def read_blocks(inf, block_size):
+    """
+    Yield the contents of an input stream in blocks of up to block_size bytes.
+    Regular files are memory-mapped, so each block is copied straight from the mapped pages
+    rather than through the file object's own buffering.
+    Other streams, such as pipes and standard input from a terminal, are read into one reusable buffer.
+    """
+    mapped = None
+    try:
+        fd = inf.fileno()
+        st = os.fstat(fd)
+        if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+            start = inf.tell()
+            mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        mapped = None
+
+    if mapped is not None:
+        with mapped:
+            for i in range(start, len(mapped), block_size):
+                yield mapped[i:i + block_size]
+        return
 
+    if not hasattr(inf, "readinto"):
+        while True:
+            block = inf.read(block_size)
+            if not block:
+                break
+            yield block
+        return
 
-def guess_format_from(filename, choices=converters.source_formats):
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    while True:
+        count = inf.readinto(buffer)
+        if not count:
+            break
+        yield bytes(view[:count])
+
+
+def guess_format_from(filename, choices=SOURCE_FORMATS):
     """
     This just checks the extention case-insensitively for the available formats
     """
@@ -63,7 +163,7 @@ def guess_format_from(filename, choices=converters.source_formats):
     return None
 
 
-def get_conversion_function(source_format, output_format, explicit_converters=[], generic_options={}, converter_options={}):
+def get_conversion_function(source_format, output_format, explicit_converters=(), generic_options={}, converter_options={}):
     """
     Part of the CLI: not intended to be called in scripts.
     Gets the appropriate conversion function for a set of format choices.
@@ -99,33 +199,25 @@ def validate_converter_option(option_string, converter_options_dict):
         sys.exit(-1)
     converter_name = parts[0]
     option_name = parts[1]
-    if converter_name not in converters.converter_names:
+    if converter_name not in converters.converter_by_name:
         sys.stderr.write(f"Converter option {option_string}:\nNo such converter: {converter_name}\n")
         sys.exit(-1)
 
-    found_option = False
+    option = converters.option_by_name[converter_name].get(option_name)
+    found_option = option is not None
     valid_value = False
-    for c in converters.converters:
-        if c.name == converter_name:
-            for o in c.options:
-                if o["name"] == option_name:
-                    found_option = True
-                    option_type = o.get("type", "choice")
-                    if option_type == "choice":
-                        for c in o["choices"]:
-                            if c["name"] == value:
-                                valid_value = True
-                                break
-                    if option_type == "int":
-                        try:
-                            value = int(value)
-                            valid_value = True
-                        except ValueError:
-                            valid_value = False
-                    if option_type == "str":
-                        valid_value = True
-                    break
-            break
+    if found_option:
+        option_type = option.get("type", "choice")
+        if option_type == "choice":
+            valid_value = value in converters.option_choices[(converter_name, option_name)]
+        if option_type == "int":
+            try:
+                value = int(value)
+                valid_value = True
+            except ValueError:
+                valid_value = False
+        if option_type == "str":
+            valid_value = True
 
     if not found_option:
         sys.stderr.write(f"Converter option {option_string}:\nNo such option for {converter_name}: {option_name}\nTry using `--converter-help {converter_name}` for more information")
@@ -153,10 +245,10 @@ def make_warning_table(user_warning_params):
             sys.exit(-1)
         converter_name = parts[0]
         warning_code = parts[1]
-        if converter_name not in converters.converter_names:
+        if converter_name not in converters.converter_by_name:
             sys.stderr.write(f"Warning handler {param_string}:\nNo such converter: {converter_name}\n")
             sys.exit(-1)
-        if treatment not in ["ignore", "display", "error"]:
+        if treatment not in WARNING_TREATMENTS:
             sys.stderr.write(f"Warning handler {param_string}:\nInvalid treatment: {treatment}\n")
             sys.exit(-1)
         r.append((converter_name, warning_code, treatment))
@@ -164,60 +256,132 @@ def make_warning_table(user_warning_params):
 
 
 def list_files(basedir=".", recursive=True):
-    for fn in os.listdir(basedir):
-        ffn = os.path.join(basedir, fn)
-        if os.path.isfile(ffn):
-            yield ffn
-        else:
-            if recursive:
-                for sfn in list_files(ffn, recursive=True):
-                    yield sfn
+    """
+    Yield the paths of the files in a directory and, if recursive is set, its subdirectories.
+    os.scandir reports the type of most entries without an extra stat call,
+    and subdirectories are walked from a stack rather than by recursion.
+    """
+    directories = [basedir]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield entry.path
+                elif recursive and entry.is_dir():
+                    directories.append(entry.path)
 
 
-def ensure_directory_for(path, verbose=False):
+def ensure_directory_for(path, verbose=False, known_directories=None):
     """
     Create the directories, if they don't exist, so the provided path is valid.
+    If a set is provided as known_directories, directories that have been ensured are added to it
+    and later calls for paths in the same directory return without checking the file system.
     """
-    head, tail = os.path.split(path)
-    if head == "" or os.path.exists(head):
+    head = os.path.dirname(path)
+    if head == "" or (known_directories is not None and head in known_directories):
         return
-    ensure_directory_for(head)
-    if verbose:
-        sys.stderr.write("Creating directory: " + head + "\n")
-    os.mkdir(head)
+    if not os.path.isdir(head):
+        if verbose:
+            sys.stderr.write(f"Creating directory: {head}\n")
+        os.makedirs(head, exist_ok=True)
+    if known_directories is not None:
+        known_directories.add(head)
 
 
-def convert_directory(directory, pattern, output_pattern, recursive, converter, default_warning_treatment, warning_table, verbose=False):
+def convert_directory(directory, pattern, output_pattern, recursive, converter, default_warning_treatment, warning_table, verbose=False, jobs=None, block_size=DEFAULT_BLOCK_SIZE):
     """
     Part of the CLI. Not intended for inclusion in scripts.
     Convert a directory of files.
+    Files are converted concurrently by up to jobs threads, defaulting to the number of processors,
+    while the directory is still being searched for more files.
+    Each file gets its own converter instance.
     """
-    # Convert the user's pattern into a regular expression
-    # Note that I'm not letting them put their own regex in here
-    # This is so that they can have one asterisk substituted with a part of their choosing,
-    # whereas allowing them to put in their own expression would break the named group that stores that bit
+    # The user's pattern is split around its asterisk into a prefix and a suffix
+    # Only one asterisk is allowed, so the part it covers can be substituted into the output name pattern
+    # A path matches if, after the directory, it starts with the prefix and ends with the suffix, ignoring case
     if pattern.count("*") > 1:
         sys.stderr.write("The search pattern may only contain one asterisk (*) character.\n")
         sys.exit(-1)
-    file_pattern = re.compile(
-        "^" + re.escape(pattern).replace("\\*", "(?P<name>.*)") + "$",
-        re.IGNORECASE
-    )
-
-    for filename in list_files(directory, recursive):
-        m = file_pattern.match(filename[len(directory):])
-        if m:
-            converted_file_name = output_pattern.replace("*", m.group("name"))
-            ensure_directory_for(converted_file_name, verbose=verbose)
-            if verbose:
-                sys.stderr.write("Converting " + filename + " to " + converted_file_name + "\n")
-            with open(filename, "rb") as input_file:
-                with open(converted_file_name, "wb") as output_file:
-                    convert_file(input_file, output_file, converter(), default_warning_treatment, warning_table)
-
+    prefix, asterisk, suffix = pattern.partition("*")
+    lower_prefix = prefix.lower()
+    lower_suffix = suffix.lower()
+    name_start = len(directory) + len(prefix)
+
+    # The directory walk runs in this thread and feeds matching files to the worker threads through a queue
+    # Output directories are created here, before a file is queued, so the workers only read and write files
+    def matching_files():
+        known_directories = set()
+        for filename in list_files(directory, recursive):
+            name_end = len(filename) - len(suffix)
+            if name_end < name_start or (not asterisk and name_end != name_start):
+                continue
+            if filename[len(directory):name_start].lower() == lower_prefix and filename[name_end:].lower() == lower_suffix:
+                converted_file_name = output_pattern.replace("*", filename[name_start:name_end])
+                ensure_directory_for(converted_file_name, verbose=verbose, known_directories=known_directories)
+                yield (filename, converted_file_name)
+
+    message_lock = threading.Lock()
+
+    def convert_one(file_job):
+        filename, converted_file_name = file_job
+        if verbose:
+            with message_lock:
+                sys.stderr.write(f"Converting {filename} to {converted_file_name}\n")
+        # Input files are only ever read in whole blocks, so they are opened without an extra layer of buffering
+        with io.FileIO(filename, "rb") as input_file:
+            with open(converted_file_name, "wb") as output_file:
+                convert_file(input_file, output_file, converter(), default_warning_treatment, warning_table, block_size, message_lock)
+
+    file_jobs = matching_files()
+    first_jobs = list(itertools.islice(file_jobs, MIN_THREADED_FILES))
+    worker_count = jobs or os.cpu_count() or 1
+    if worker_count == 1 or len(first_jobs) < MIN_THREADED_FILES:
+        # Too few files to be worth starting threads
+        for file_job in itertools.chain(first_jobs, file_jobs):
+            convert_one(file_job)
+        return
 
-def main(argv):
-    "The CLI frontend for the converter tool"
+    job_queue = queue.Queue(maxsize=DIRECTORY_QUEUE_SIZE)
+    failures = []
+    stopping = threading.Event()
+
+    def worker():
+        while True:
+            file_job = job_queue.get()
+            if file_job is None:
+                return
+            if stopping.is_set():
+                # Keep emptying the queue so the walk is never blocked, but don't start any more files
+                continue
+            try:
+                convert_one(file_job)
+            except BaseException as e:
+                # A warning treated as an error exits from a worker. It is raised again in this thread
+                failures.append(e)
+                stopping.set()
+
+    workers = [threading.Thread(target=worker) for _ in range(worker_count)]
+    for w in workers:
+        w.start()
+    try:
+        for file_job in itertools.chain(first_jobs, file_jobs):
+            if stopping.is_set():
+                break
+            job_queue.put(file_job)
+    except BaseException:
+        stopping.set()
+        raise
+    finally:
+        for w in workers:
+            job_queue.put(None)
+        for w in workers:
+            w.join()
+    if failures:
+        raise failures[0]
+
+
+def make_argument_parser():
+    "Part of the CLI. Builds the parser for the command line arguments"
 
     args = argparse.ArgumentParser(
         description="Convert between raw braille file formats",
@@ -229,6 +393,8 @@ def main(argv):
     args.add_argument("--version", help="Print the version of the tool", action="store_true")
     args.add_argument("-v", "--verbose",
         help="Print progress messages to standard error", action="store_true")
+    args.add_argument("-bs", "--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+        help=f"The number of bytes read from an input file and converted at a time. Defaults to {DEFAULT_BLOCK_SIZE}. Unicode encoding detection always waits for a full sample of the input, so the block size does not change which encoding is chosen.", action="store")
 
     # Input args are not required because having a required group will block special options like --converter-help
     # For normal usage, exactly one is required and this will be checked
@@ -257,53 +423,61 @@ def main(argv):
         action="store")
     directory_args.add_argument("-r", "--recursive",
         help="Process subdirectories recursively", action="store_true")
+    directory_args.add_argument("-j", "--jobs", type=int,
+        help="The number of files to convert at the same time. Defaults to the number of processors.", action="store")
 
     args.add_argument("-sf", "--source-format",
         help="Specify the format of the source file. If not provided, it will be assumed from file names", action="store",
-        choices=converters.source_formats)
+        choices=SOURCE_FORMATS)
     args.add_argument("-of", "--output-format",
         help="Specify the format of the output file. If not provided, it will be assumed from file names", action="store",
-        choices=converters.output_formats)
+        choices=OUTPUT_FORMATS)
 
     args.add_argument("-c", "--converter", action="append",
         help="Specify a converter to use. Format converters can usually be assigned automatically.",
-        choices=converters.converter_names, default=[])
+        choices=CONVERTER_NAMES, default=[])
     args.add_argument("-co", "--converter-option", action="append", default=[],
         help="Specify an option of a converter. For a list, use the --converter-help argument.")
     args.add_argument("--converter-help",
         help="Get information about a converter and its options.",
-        choices=converters.converter_names)
+        choices=CONVERTER_NAMES)
 
     args.add_argument("--warnings",
         help="Set default handling for converter warnings",
-        choices=["display", "ignore", "error"], default="display")
+        choices=WARNING_TREATMENTS, default="display")
     args.add_argument("--warning", action="append",
         help="Set handling for specific converter warnings. Use the format <converter_name>.<warning_name>={display,ignore,error}",
         default=[])
+    return args
 
-    if "--help" in sys.argv:
-        args.print_help(file=sys.stderr)
+
+def main(argv):
+    "The CLI frontend for the converter tool"
+
+    # The version is printed without building the argument parser. --help takes precedence if both are given
+    if "--version" in argv and "--help" not in argv:
+        sys.stderr.write(f"BRL2BRF version {VERSION}\nWritten by Seeing Hands\n")
         sys.exit(0)
 
-    if "--version" in sys.argv:
-        sys.stderr.write("BRL2BRF version " + VERSION + "\nWritten by Seeing Hands\n")
+    args = make_argument_parser()
+
+    if "--help" in argv:
+        args.print_help(file=sys.stderr)
         sys.exit(0)
 
     try:
         config = args.parse_args()
     except argparse.ArgumentError as ae:
         args.print_usage(file=sys.stderr)
-        sys.stderr.write(str(ae) + "\n")
+        sys.stderr.write(f"{ae}\n")
         sys.stderr.write("For more information, specify --help\n")
         sys.exit(-1)
 
     # Set up converters requested on the command line
     # Print converter help if requested
     if config.converter_help is not None:
-        for c in converters.converters:
-            if c.name == config.converter_help:
-                sys.stderr.write(c.usage())
-                sys.exit(0)
+        sys.stderr.write(converters.converter_by_name[config.converter_help].usage())
+        sys.exit(0)
 
     generic_options = {}
 
@@ -313,24 +487,73 @@ def main(argv):
 
     warning_table = make_warning_table(config.warning)
 
-    converter = None
+    if config.block_size < 1:
+        sys.stderr.write("The --block-size parameter must be at least 1.\n")
+        sys.exit(-1)
 
+    input_file = None
+    output_file = None
+    source_format = config.source_format
+    output_format = config.output_format
+
+    # Gather the formats for the mode in use. The conversion itself is looked up once afterwards
     if config.directory is not None:
         if config.pattern is None:
             sys.stderr.write("The --pattern parameter is required when using directory mode. Specify --help for more information.\n")
             sys.exit(-1)
-        source_format = config.source_format
         if source_format is None:
-            source_format = guess_format_from(config.pattern, choices=converters.source_formats)
-        output_format = config.output_format
+            source_format = guess_format_from(config.pattern, choices=SOURCE_FORMATS)
         if output_format is None and config.name_pattern is not None:
-            output_format = guess_format_from(config.name_pattern, choices=converters.output_formats)
-        converter, source_format, output_format = get_conversion_function(source_format, output_format, config.converter, generic_options, converter_options)
+            output_format = guess_format_from(config.name_pattern, choices=OUTPUT_FORMATS)
+    else:
+        # Not set to directory mode, convert a single file
+        # Check that we have input arguments that we need
+        if not config.stdin and config.file is None:
+            args.print_usage(file=sys.stderr)
+            sys.stderr.write("Error: Exactly one of the --stdin, --file, or --directory options are required.\n")
+            sys.exit(-1)
+
+        # Check that we have output arguments that we need
+        if not config.stdout and config.output is None:
+            args.print_usage(file=sys.stderr)
+            sys.stderr.write("Error: Neither --stdout nor --output were specified.\n")
+            sys.exit(-1)
+
+        if config.stdin:
+            input_file = sys.stdin.buffer
+        else:
+            try:
+                input_file = io.FileIO(config.file, "rb")
+            except FileNotFoundError:
+                sys.stderr.write(f"Could not open file: {config.file}.\n")
+                sys.exit(-1)
+
+            if source_format is None:
+                source_format = guess_format_from(config.file, choices=SOURCE_FORMATS)
+
+        if config.stdout:
+            output_file = sys.stdout.buffer
+        else:
+            try:
+                output_file = open(config.output, "wb")
+            except FileNotFoundError:
+                sys.stderr.write(f"Could not open file: {config.output} for writing.\n")
+                sys.exit(-1)
+
+            if output_format is None:
+                output_format = guess_format_from(config.output, choices=OUTPUT_FORMATS)
+
+    converter, source_format, output_format = get_conversion_function(source_format, output_format, config.converter, generic_options, converter_options)
+
+    if config.directory is not None:
         output_pattern = config.name_pattern
         if output_pattern is None:
-            output_pattern = "*." + output_format
+            output_pattern = f"*.{output_format}"
+        if config.jobs is not None and config.jobs < 1:
+            sys.stderr.write("The --jobs parameter must be at least 1.\n")
+            sys.exit(-1)
         if not os.path.exists(config.directory):
-            sys.stderr.write("Could not open directory: " + config.directory)
+            sys.stderr.write(f"Could not open directory: {config.directory}\n")
             sys.exit(-1)
         return convert_directory(
             config.directory,
@@ -340,53 +563,12 @@ def main(argv):
             converter,
             config.warnings,
             warning_table,
-            config.verbose
+            config.verbose,
+            config.jobs,
+            config.block_size
         )
 
-    # Not set to directory mode, convert a single file
-    # Check that we have input arguments that we need
-    if not config.stdin and config.file is None:
-        args.print_usage(file=sys.stderr)
-        sys.stderr.write("Error: Exactly one of the --stdin, --file, or --directory options are required.\n")
-        sys.exit(-1)
-
-    input_file = None
-    output_file = None
-    source_format = config.source_format
-    output_format = config.output_format
-
-    # Check that we have output arguments that we need
-    if not config.stdout and config.output is None:
-        args.print_usage(file=sys.stderr)
-        sys.stderr.write("Error: Neither --stdout nor --output were specified.\n")
-        sys.exit(-1)
-
-    if config.stdin:
-        input_file = sys.stdin.buffer
-    else:
-        try:
-            input_file = open(config.file, "rb")
-        except FileNotFoundError:
-            sys.stderr.write("Could not open file: " + config.file + ".\n")
-            sys.exit(-1)
-
-        if source_format is None:
-            source_format = guess_format_from(config.file, choices=converters.source_formats)
-
-    if config.stdout:
-        output_file = sys.stdout.buffer
-    else:
-        try:
-            output_file = open(config.output, "wb")
-        except FileNotFoundError:
-            sys.stderr.write("Could not open file: " + config.file + " for writing.\n")
-            sys.exit(-1)
-
-        if output_format is None:
-            output_format = guess_format_from(config.output, choices=converters.output_formats)
-
-    converter, source_format, output_format = get_conversion_function(source_format, output_format, config.converter, generic_options, converter_options)
-    convert_file(input_file, output_file, converter(), config.warnings, warning_table)
+    convert_file(input_file, output_file, converter(), config.warnings, warning_table, config.block_size)
     if not config.stdin:
         input_file.close()
 
@@ -2,9 +2,11 @@
 # This directory contains converter modules which encode or decode a certain format
 # Each converter is an instance of class brl2brf.converter
 # This file contains generic utilities for tracking and working with converters
-from .converter import converter, ConverterError, converter_chain
+import collections
+import functools
+from .converter import converter, ConverterError, converter_chain, translation_converter
 
-# Add any new converters to this list
+# Add any new converters to the converters tuple below
 from . import brl
 from . import kwb
 from . import helptech
@@ -14,7 +16,7 @@ from . import pef
 from . import brf
 from . import reflow
 
-converters = [
+converters = (
     brl.brl_to_brf,
     brl.brf_to_brl,
     kwb.kwb_to_brf,
@@ -30,27 +32,44 @@ converters = [
     ldf.brf_to_ldf,
     pef.pef_to_unicode,
     reflow.reflow
-]
+)
 
-source_formats = sorted(list(set(
-    [c.source_format for c in converters]
+# The registry is fixed after import, so these are kept as tuples
+source_formats = tuple(sorted(set(
+    c.source_format for c in converters
 )))
 
-output_formats = sorted(list(set(
-    [c.output_format for c in converters]
+output_formats = tuple(sorted(set(
+    c.output_format for c in converters
 )))
 
-converter_names = sorted(
-    [c.name for c in converters]
-)
+converter_names = tuple(sorted(
+    c.name for c in converters
+))
+
+# Sets of the same formats, for membership checks
+source_format_set = frozenset(source_formats)
+output_format_set = frozenset(output_formats)
+
+# The converters that read each format, in the order of the converters list, for walking the format graph
+converters_by_source = {f: [c for c in converters if c.source_format == f] for f in source_formats}
+
+# Indexes for looking up converters, their options, and the valid choices of each option by name
+converter_by_name = {c.name: c for c in converters}
+option_by_name = {
+    c.name: {o["name"]: o for o in c.options}
+    for c in converters
+}
+option_choices = {
+    (c.name, o["name"]): frozenset(choice["name"] for choice in o["choices"])
+    for c in converters
+    for o in c.options
+    if o.get("type", "choice") == "choice"
+}
 
 
 def get_converter(converter_name, generic_options, converter_options):
-    converter = None
-    for c in converters:
-        if c.name == converter_name:
-            converter = c
-            break
+    converter = converter_by_name.get(converter_name)
     if converter is None:
         raise ValueError(f"No such converter: {converter_name}")
 
@@ -63,18 +82,10 @@ def chain_converters(cnames, generic_options, converter_options):
     if len(cnames) == 0:
         raise ValueError("Cannot construct a chain of zero converters.")
     if len(cnames) == 1:
-        options = {}
-        for co in converter_options.keys():
-            if co == cnames[0]:
-                options = converter_options[co]
-        return get_converter(cnames[0], generic_options, options)
+        return get_converter(cnames[0], generic_options, converter_options.get(cnames[0], {}))
     chain = []
-    for i in range(len(cnames)):
-        options = {}
-        for co in converter_options:
-            if co == cnames[i]:
-                options = converter_options[co]
-        chain.append(get_converter(cnames[i], generic_options, options))
+    for cname in cnames:
+        chain.append(get_converter(cname, generic_options, converter_options.get(cname, {})))
 
     def make_chain_instance():
         cs = []
@@ -85,7 +96,7 @@ def chain_converters(cnames, generic_options, converter_options):
     return make_chain_instance
 
 
-def find_converter(source_format, output_format, explicit_converters=[], generic_options={}, converter_options={}):
+def find_converter(source_format, output_format, explicit_converters=(), generic_options={}, converter_options={}):
     """
     Find the converter or set of converters that takes the provided source format, results in the provided output format,
     and includes any converters specified explicitly.
@@ -104,40 +115,55 @@ def find_converter(source_format, output_format, explicit_converters=[], generic
     Note: This function returns a creator which can be called repeatedly to generate more instances of the same converter with the same configuration.
     """
 
-    shortest = []
-    shortest_length = len(converters)
-    for chain in find_converter_chain(source_format, output_format):
-        if len(chain) < shortest_length:
-            valid_chain = True
-            for ec in explicit_converters:
-                if ec not in chain:
-                    valid_chain = False
-                    break
-            if valid_chain:
-                shortest = chain
-                shortest_length = len(chain)
-    if len(shortest) == 0:
+    chain = find_converter_chain(source_format, output_format, explicit_converters)
+    if chain is None:
         return None
-    return chain_converters(shortest, generic_options, converter_options)
+    return chain_converters(chain, generic_options, converter_options)
 
 
-def find_converter_chain(source_format, output_format, chain=[]):
+def find_converter_chain(source_format, output_format, explicit_converters=()):
+    """
+    Graph-walk converters to find the shortest chain that includes the explicit converters. This is an internal function.
+    Returns a tuple of converter names, or None if there is no such chain.
+    The registry does not change after import, so results are cached. See clear_find_converter_cache.
     """
-    Graph-walk converters to find possible paths. This is an internal function.
+    return shortest_converter_chain(source_format, output_format, frozenset(explicit_converters))
+
 
-    Performance note: This is an exhaustive search. It is fine when we have 2-10 converters and probably works fine with quite a few more.
-    If we ever get a hundred converters, this should be improved.
+def clear_find_converter_cache():
+    "Forget the converter chains found so far, for example between tests."
+    shortest_converter_chain.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def shortest_converter_chain(source_format, output_format, required):
+    """
+    The search behind find_converter_chain. This is an internal function.
+    required is the frozenset of converter names that must be in the chain.
+
+    The walk is breadth-first, so the first chain found is a shortest one.
+    Among chains of the same length, the one whose converters come earliest in the converters list is found first.
+    A chain that reaches a format having picked up the same explicit converters as an earlier, shorter one is not extended.
     """
-    if source_format not in source_formats:
-        return
-    if output_format not in output_formats:
-        return
-    for c in converters:
-        if c.name in chain:
-            # Converters may not occur twice in a chain
-            continue
-        if c.source_format == source_format:
-            if c.output_format == output_format:
-                yield chain + [c.name]
-            for subchain in find_converter_chain(c.output_format, output_format, chain + [c.name]):
-                yield subchain
+    if source_format not in source_format_set:
+        return None
+    if output_format not in output_format_set:
+        return None
+    start = (source_format, frozenset())
+    visited = {start}
+    pending = collections.deque([(start, ())])
+    while pending:
+        (current_format, found), chain = pending.popleft()
+        for c in converters_by_source.get(current_format, []):
+            if c.name in chain:
+                # Converters may not occur twice in a chain
+                continue
+            next_chain = chain + (c.name,)
+            next_found = found | required.intersection([c.name])
+            if c.output_format == output_format and next_found == required:
+                return next_chain
+            state = (c.output_format, next_found)
+            if state not in visited:
+                visited.add(state)
+                pending.append((state, next_chain))
+    return None
@@ -1,11 +1,52 @@
 # BRF and Unicode converter
 # Note: This code used to be in the unicode.py module
 # It was moved so that all the code in the unicode module is generic
+import codecs
+import re
 from .unicode import UnicodeConverter
 
 brf_table_chars = " A1B'K2L@CIF/MSP\"E3H9O6R^DJG>NTQ,*5<-U8V.%[$+X!&;:4\\0Z7(_?W]#Y)="
 brf_table_bytes = b" A1B'K2L@CIF/MSP\"E3H9O6R^DJG>NTQ,*5<-U8V.%[$+X!&;:4\\0Z7(_?W]#Y)="
 
+# Translation tables for unicode_to_brf, one for each way of handling characters with dots 7 or 8
+# Characters outside the Braille block are not in any table, so str.translate leaves them as they are
+six_dot_table = {0x2800 + i: c for i, c in enumerate(brf_table_chars)}
+eight_dot_deleted_table = {**six_dot_table, **{cn: None for cn in range(0x2840, 0x2900)}}
+eight_dot_tables = {
+    "warn": eight_dot_deleted_table,
+    "delete": eight_dot_deleted_table,
+    "bypass": six_dot_table,
+    "strip": {**six_dot_table, **{cn: brf_table_chars[(cn - 0x2800) % len(brf_table_chars)] for cn in range(0x2840, 0x2900)}}
+}
+eight_dot_pattern = re.compile("[\u2840-\u28ff]")
+
+# Decoding table for brf_to_unicode: the character for each byte value, as the charmap codec takes it
+# A 256 character table is looked up directly in C, much faster than translating with a dict
+# Bytes that are not BRF characters pass through unchanged, as in latin-1
+brf_decode_table = "".join(
+    chr(0x2800 + brf_table_bytes.index(b)) if b in brf_table_bytes else chr(b) for b in range(256)
+)
+
+# Text without 8 dot characters is encoded with the charmap codec, which writes the BRF byte of each character in C
+# U+2800 shares the byte of the space, so blank cells are changed to spaces before encoding
+# Other ASCII characters without a BRF meaning map to themselves. The rest, which is ASCII that collides with
+# BRF bytes and anything outside ASCII, goes in runs to an error handler that translates and encodes it as before
+brf_encoding_map = codecs.charmap_build("".join(
+    " " if b == 0x20 else
+    chr(0x2800 + brf_table_bytes.index(b)) if b in brf_table_bytes else
+    chr(b) if b < 0x80 else
+    "\ufffe"  # Left out of the map
+    for b in range(256)
+))
+
+
+def encode_unmapped_brf(error):
+    return error.object[error.start:error.end].translate(six_dot_table).encode("UTF-8"), error.end
+
+
+# charmap_encode only accepts an error handler by registered name, so this one is registered once, under a name no other code would use
+codecs.register_error("brl2brf.unicode_to_brf", encode_unmapped_brf)
+
 
 class unicode_to_brf (UnicodeConverter):
     name = "unicode_to_brf"
@@ -40,6 +81,8 @@ class unicode_to_brf (UnicodeConverter):
     def __init__(self, generic_options={}, converter_options={}):
         UnicodeConverter.__init__(self, generic_options, converter_options)
         self.eight_dot_behavior = converter_options.get("eight_dot_characters", "warn")
+        # Unknown behaviors leave the 8-dot characters out, as warn and delete do
+        self.table = eight_dot_tables.get(self.eight_dot_behavior, eight_dot_deleted_table)
 
     def convert(self, unicode):
         """
@@ -51,23 +94,17 @@ class unicode_to_brf (UnicodeConverter):
             Unicode codepoints using dots 7 and 8 will trigger a warning.
             Other characters will be ignored.
         """
-        brf = ""
-        for c in self.unicode_decode(unicode):
-            cn = ord(c)
-            if cn < 0x2800 or cn >= 0x2900:
-                brf += c
-            elif cn >= 0x2840:
-                if self.eight_dot_behavior == "warn":
-                    self.warning("8_to_6_dot_conversion", f"The character {c} cannot be directly converted to BRF, which only supports 6 dot characters.")
-                elif self.eight_dot_behavior == "delete":
-                    continue
-                elif self.eight_dot_behavior == "strip":
-                    brf += brf_table_chars[(cn - 0x2800) % len(brf_table_chars)]
-                elif self.eight_dot_behavior == "bypass":
-                    brf += c
-            else:
-                brf += brf_table_chars[cn - 0x2800]
-        return brf.encode(self.output_encoding)
+        text = self.unicode_decode(unicode)
+        if self.eight_dot_behavior == "warn":
+            eight_dot_chars = eight_dot_pattern.findall(text)
+            if eight_dot_chars:
+                self.character_warning("8_to_6_dot_conversion", eight_dot_chars,
+                    f"The character {eight_dot_chars[0]} cannot be directly converted to BRF, which only supports 6 dot characters.",
+                    "characters cannot be directly converted to BRF, which only supports 6 dot characters")
+        # 8 dot characters would each need a call to the error handler, so text with them is translated instead
+        if self.output_encoding == "UTF-8" and eight_dot_pattern.search(text) is None:
+            return codecs.charmap_encode(text.replace("\u2800", " "), "brl2brf.unicode_to_brf", brf_encoding_map)[0]
+        return text.translate(self.table).encode(self.output_encoding)
 
 
 class brf_to_unicode (UnicodeConverter):
@@ -77,13 +114,7 @@ class brf_to_unicode (UnicodeConverter):
     options = UnicodeConverter.output_options
 
     def convert(self, brf):
-        unicode = ""
-        for c in brf:
-            if c in brf_table_bytes:
-                unicode += chr(0x2800 + brf_table_bytes.index(c))
-            else:
-                unicode += chr(c)
-        return unicode.encode(self.output_encoding)
+        return self.unicode_encode(codecs.charmap_decode(brf, "strict", brf_decode_table)[0])
 
     def close(self):
         # The input buffer is not used. Skip unicode_converter version
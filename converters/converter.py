@@ -4,6 +4,10 @@ class ConverterError(Exception):
     """
 
 
+# The most distinct characters listed in one character warning
+MAX_LISTED_CHARACTERS = 20
+
+
 class converter:
     """
     The converter class represents a generic format converter.
@@ -26,7 +30,8 @@ class converter:
     def __init__(self, generic_options={}, converter_options={}):
         if self.source_format is None or self.output_format is None:
             raise NotImplementedError("The source or output format is not set.")
-        self.input_buffer = b""
+        # Converters that hold data between blocks can extend this in place, rather than copying it into a new string for each block
+        self.input_buffer = bytearray()
         self.warnings = []
         self.closed = False
 
@@ -91,12 +96,12 @@ class converter:
                     r += "    Type: integer\n"
                     for k in ["minimum", "maximum", "default"]:
                         if k in o.keys():
-                            r += f"    {k.title()}: {o[k]}"
+                            r += f"    {k.title()}: {o[k]}\n"
                 if otype == "str":
                     r += "    Type: string\n"
                     for k in ["default"]:
                         if k in o.keys():
-                            r += f"    {k.title()}: {o[k]}"
+                            r += f"    {k.title()}: {o[k]}\n"
 
         return r
 
@@ -114,10 +119,61 @@ class converter:
         """
         self.warnings.append((self.name, warning_code, warning_description))
 
+    def character_warning(self, warning_code, characters, single_description, multiple_description):
+        """
+        Add one warning for every character in a block that has the same problem, rather than one warning each.
+
+        Parameters:
+            characters: The characters that caused the warning, in the order they appear. Nothing is added if this is empty.
+            single_description: The warning description when there is only one character.
+            multiple_description: Used when there are several. It is prefixed by the number of characters
+                and followed by the distinct characters, in order of appearance and up to MAX_LISTED_CHARACTERS of them.
+        """
+        if len(characters) == 0:
+            return
+        if len(characters) == 1:
+            self.warning(warning_code, single_description)
+            return
+        distinct = list(dict.fromkeys(characters))
+        listing = ", ".join(str(c) for c in distinct[:MAX_LISTED_CHARACTERS])
+        if len(distinct) > MAX_LISTED_CHARACTERS:
+            listing += ", ..."
+        self.warning(warning_code, f"{len(characters)} {multiple_description}: {listing}")
+
     def clear_warnings(self):
         self.warnings = []
 
 
+class translation_converter(converter):
+    """
+    A converter whose conversion maps every byte to exactly one other byte.
+    Subclasses set table to a 256-byte translation table, for example one made with bytes.maketrans.
+    The whole conversion is then a single bytes.translate call, which runs in C over each chunk.
+    Because no state is kept between chunks, chunks can be of any size and split anywhere.
+    """
+
+    table = None
+
+    def convert(self, s):
+        return s.translate(self.table)
+
+
+def fuse_translations(converters):
+    """
+    Combine each run of adjacent translation converters in a list of converter instances into the first converter of the run.
+    Applying one translation table after another is itself a single byte-to-byte mapping,
+    so the combined converter does the work of the whole run in one bytes.translate pass.
+    Returns the new list. Converters other than translation converters are kept in place.
+    """
+    fused = []
+    for c in converters:
+        if fused and isinstance(c, translation_converter) and isinstance(fused[-1], translation_converter):
+            fused[-1].table = fused[-1].table.translate(c.table)
+        else:
+            fused.append(c)
+    return fused
+
+
 class converter_chain(converter):
     """
     A class that chains multiple converters together. It otherwise acts as its own converter
@@ -127,7 +183,7 @@ class converter_chain(converter):
         self.source_format = converters[0].source_format
         self.output_format = converters[-1].output_format
         converter.__init__(self)
-        self.converters = converters
+        self.converters = fuse_translations(converters)
 
     def convert(self, s):
         for c in self.converters:
@@ -153,5 +209,7 @@ class converter_chain(converter):
         self.warnings.append((warning_source, warning_code, warning_desc))
 
     def collect_warnings(self, c):
+        # The sub-converter's warnings are cleared once forwarded, so that each is only reported once
         for warning_source, warning_code, warning_desc in c.warnings:
             self.warning(warning_code, warning_desc, warning_source)
+        c.clear_warnings()
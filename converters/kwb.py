@@ -1,7 +1,7 @@
 # Converter from KWB format
 # Note: BRF format is considered the canonical format, so most converters are named based on the other one and convert to or from BRF
 # This is not a requirement, just a tendency
-from .converter import converter
+from .converter import converter, ConverterError
 
 
 class kwb_to_brf (converter):
@@ -36,6 +36,7 @@ class kwb_to_brf (converter):
     # Constant characters
     SECTION_SEPARATOR = b"\x1a" # Found at end of header and content sections
     TEXT_SEPARATOR = b"\x02" # Found at boundaries between renderable content and non-renderable data
+    READABLE_CHARACTERS = b"\n\r !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_" # Content chunks made only of these are converted
 
     def __init__(self, generic_options={}, converter_options={}):
         converter.__init__(self, generic_options=generic_options, converter_options=converter_options)
@@ -49,6 +50,7 @@ class kwb_to_brf (converter):
         else:
             raise ValueError(f"Unexpected setting for line break behavior: {converter_options.get('linebreaks', 'space')}")
 
+        # Content is collected in the input buffer until its chunk ends
         self.header = b""
         self.stage = 0
         # stages:
@@ -60,60 +62,64 @@ class kwb_to_brf (converter):
         """
         Determines if a content section is readable or not and converts it if it is.
         """
-        READABLE_CHARACTERS = b"\n\r !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_"
-        for ci in range(len(kwb)):
-            if kwb[ci] not in READABLE_CHARACTERS:
-                # Not readable. Reject
-                return b""
+        # Deleting every readable character leaves nothing unless the section has something else in it
+        if kwb.translate(None, self.READABLE_CHARACTERS):
+            # Not readable. Reject
+            return b""
         return kwb.replace(b"\r", self.autolinebreak_str).replace(b"\n", b"\r\n")
 
     def convert(self, kwb):
         """
         Convert a KWB-formatted string to BRF.
+        The string is scanned once from left to right, with each separator ending the current header or content chunk.
         """
+        converted = []
+        start = 0
 
         if self.stage == 0: # parsing header
-            parts = kwb.split(self.SECTION_SEPARATOR)
-            self.header += parts[0]
-            if len(parts) > 1:
-                self.stage = 1
-                if len(self.header) != 512:
-                    self.warning("kwb_format_unexpected",
-                        f"KWB header has unexpected length:\nExpected: 512, actual: {len(self.header)}"
-                    )
-                return self.convert(kwb[kwb.index(self.SECTION_SEPARATOR)+1:])
-            else:
+            end = kwb.find(self.SECTION_SEPARATOR)
+            if end == -1:
+                self.header += kwb
                 return b""
+            self.header += kwb[0:end]
+            self.stage = 1
+            if len(self.header) != 512:
+                self.warning("kwb_format_unexpected",
+                    f"KWB header has unexpected length:\nExpected: 512, actual: {len(self.header)}"
+                )
+            start = end + 1
 
-        elif self.stage == 1:
+        while self.stage == 1:
             # building content chunks
-            if kwb.count(self.TEXT_SEPARATOR) > 0:
-                self.input_buffer += kwb[0:kwb.index(self.TEXT_SEPARATOR)]
-                converted = self.convert_section(self.input_buffer)
-                self.input_buffer = b""
-                return (converted + self.convert(kwb[kwb.index(self.TEXT_SEPARATOR)+1:]))
-            elif kwb.count(self.SECTION_SEPARATOR) > 0:
-                self.input_buffer += kwb[0:kwb.index(self.SECTION_SEPARATOR)]
-                converted = self.convert_section(self.input_buffer)
-                self.input_buffer = b""
-                self.stage = 2
-                return (converted + self.convert(kwb[kwb.index(self.SECTION_SEPARATOR)+1:]))
+            text_end = kwb.find(self.TEXT_SEPARATOR, start)
+            section_end = kwb.find(self.SECTION_SEPARATOR, start)
+            if text_end == -1 and section_end == -1:
+                self.input_buffer += memoryview(kwb)[start:]
+                return b"".join(converted)
+            if section_end == -1 or (text_end != -1 and text_end < section_end):
+                end = text_end
             else:
-                self.input_buffer += kwb
-                return b""
+                end = section_end
+                self.stage = 2
+            self.input_buffer += memoryview(kwb)[start:end]
+            converted.append(self.convert_section(bytes(self.input_buffer)))
+            self.input_buffer.clear()
+            start = end + 1
 
-        elif self.stage == 2:
+        if self.stage == 2:
             # content has ended
-            if len(kwb) > 0:
+            if start < len(kwb):
                 self.warning("kwb_format_unexpected",
                 "Unexpected data found after content section")
-            return b""
+            return b"".join(converted)
 
-        else:
-            raise ConverterError(f"Unknown stage value: {self.stage}")
+        raise ConverterError(f"Unknown stage value: {self.stage}")
 
     def close(self):
         self.closed = True
         if self.input_buffer != b"":
-            return self.convert(self.input_buffer)
+            # The content section was not terminated. Treat the end of the file as its end
+            converted = self.convert_section(bytes(self.input_buffer))
+            self.input_buffer.clear()
+            return converted
         return b""
@@ -3,8 +3,9 @@
 # BRF is used as the destination format because LDF's Braille format is closest to it
 # Except that LDF Braille renders letters in lowercase
 
-from .converter import converter
+from .converter import converter, ConverterError
 from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 import zipfile
 import io
 
@@ -32,7 +33,7 @@ class brf_to_ldf (converter):
         {
             "name": "ldf_type",
             "description": "The type of the content in the LDF file",
-            "options": [
+            "choices": [
                 {
                     "name": "braille",
                     "description": "Braille content, in EBAE grade 2 English Braille",
@@ -48,54 +49,52 @@ class brf_to_ldf (converter):
 
     def __init__(self, generic_options, converter_options):
         converter.__init__(self, generic_options=generic_options, converter_options=converter_options)
-        self.content_xml = ElementTree.Element("content", {"type": LDF_TYPE})
+        # Lines are collected in the input buffer until a line break arrives
+        # The paragraph text handling depends only on the content type, so it is chosen once here
+        # Braille in LDF is written in lowercase
         if converter_options.get("ldf_type", "braille") == "text":
             self.content_type = "text/plain"
+            self.ldf_text = str
         else:
             self.content_type = "text/braille"
-
-    def ldf_text(self, data):
-        if self.content_type == "text/plain":
-            return data
-        elif self.content_type == "text/braille":
-            return data.lower()
-        else:
-            raise ConverterError("Unknown content type {self.content_type}")
+            self.ldf_text = str.lower
+        # The content file is written out directly as it is built, in the layout ElementTree.indent would give it
+        self.content_xml = bytearray(f'<content type="{LDF_TYPE}">'.encode("us-ascii"))
+        self.text_start = f'\n\t<p allignment="left">\n\t\t<text content_type="{self.content_type}" style="default">'.encode("us-ascii")
 
     def convert(self, brf, closing=False):
         self.input_buffer += brf
-        while b"\n" in self.input_buffer:
-            i = self.input_buffer.index(b"\n")
-            paragraph_text = self.input_buffer[0:i].strip(b"\r")
+        start = 0
+        i = self.input_buffer.find(b"\n")
+        while i != -1:
+            paragraph_text = self.input_buffer[start:i].strip(b"\r")
             self.add_paragraph(paragraph_text)
-            self.input_buffer = self.input_buffer[i + 1:]
+            start = i + 1
+            i = self.input_buffer.find(b"\n", start)
+        # Complete lines are removed from the buffer all at once
+        del self.input_buffer[0:start]
         if closing:
             self.add_paragraph(self.input_buffer)
-            self.input_buffer = b""
+            self.input_buffer.clear()
         return b""
 
     def add_paragraph(self, text):
-        paragraph = ElementTree.Element("p", {"allignment": "left"})
-        if text != b"":
-            textblock = ElementTree.Element("text",
-                {
-                    "content_type": self.content_type,
-                    "style": "default"
-                },
-            )
-            textblock.text = self.ldf_text(text.decode("UTF-8"))
-            paragraph.append(textblock)
-        self.content_xml.append(paragraph)
+        if text == b"":
+            self.content_xml += b'\n\t<p allignment="left"></p>'
+            return
+        self.content_xml += self.text_start
+        # Characters outside ASCII become character references, as ElementTree writes them in a us-ascii document
+        self.content_xml += escape(self.ldf_text(text.decode("UTF-8"))).encode("us-ascii", "xmlcharrefreplace")
+        self.content_xml += b"</text>\n\t</p>"
 
     def close(self):
         if self.input_buffer != "":
             self.convert(b"", closing=True)
-        content = ElementTree.ElementTree(self.content_xml)
+        self.content_xml += b"\n</content>"
         zf = io.BytesIO()
         z = zipfile.ZipFile(zf, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=False)
         cf = z.open(LDF_CONTENT_FILE_NAME, "w")
-        ElementTree.indent(content, space="\t")
-        content.write(cf, encoding='us-ascii', xml_declaration=False, short_empty_elements=False)
+        cf.write(self.content_xml)
         cf.close()
         z.close()
         return zf.getvalue()
@@ -119,7 +118,8 @@ class ldf_to_brf (converter):
     def close(self):
         # All conversion occurs here
         self.ldf_file.seek(0)
-        output_buffer = io.BytesIO()
+        # Text is gathered straight into the output, which is returned without another copy through BytesIO
+        output_buffer = bytearray()
         z = zipfile.ZipFile(self.ldf_file, "r")
         for fn in z.namelist():
             if fn != LDF_CONTENT_FILE_NAME:
@@ -142,10 +142,10 @@ class ldf_to_brf (converter):
                     self.warning("formatting_removed", f"Unknown style value {textblock.attrib['style']} has been discarded.")
                 content_type = textblock.attrib.get("content_type", "None specified")
                 if content_type == "text/braille":
-                    output_buffer.write(textblock.text.encode("UTF-8").upper())
+                    output_buffer += textblock.text.encode("UTF-8").upper()
                 else:
                     if content_type != "text/plain":
                         self.warning("unexpected_content_type", f"The type {content_type} is unknown and will be treated as text")
-                    output_buffer.write(textblock.text.encode("UTF-8"))
-            output_buffer.write(b"\r\n")
-        return output_buffer.getvalue()
+                    output_buffer += textblock.text.encode("UTF-8")
+            output_buffer += b"\r\n"
+        return bytes(output_buffer)
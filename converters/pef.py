@@ -5,7 +5,6 @@
 
 from .unicode import UnicodeConverter
 from xml.etree import ElementTree
-import io
 
 # The PEF XML namespace. The URI is broken
 PEF_NS = "http://www.daisy.org/ns/2008/pef"
@@ -13,6 +12,14 @@ PEF_NS = "http://www.daisy.org/ns/2008/pef"
 def pef_tag(tag):
     return "{" +PEF_NS +"}" +tag
 
+# Expanded names of the elements the decoder looks for, so they are not rebuilt for every element
+PEF_TAG = pef_tag("pef")
+HEAD_TAG = pef_tag("head")
+BODY_TAG = pef_tag("body")
+ROW_TAG = pef_tag("row")
+# Elements known to hold rows
+CONTAINER_TAGS = frozenset([pef_tag("volume"), pef_tag("section"), pef_tag("page")])
+
 class pef_to_unicode(UnicodeConverter):
     name = "pef_to_unicode"
     source_format = "pef"
@@ -21,44 +28,72 @@ class pef_to_unicode(UnicodeConverter):
 
     def __init__(self, generic_options, converter_options):
         UnicodeConverter.__init__(self, generic_options=generic_options, converter_options=converter_options)
-        self.pef_file = io.BytesIO()
+        # The document is parsed as it arrives. Rows are converted as soon as they end
+        self.parser = ElementTree.XMLPullParser(events=("start", "end"))
+        self.depth = 0
+        self.skip_depth = None
+        self.in_row = False
+        self.rows_written = False
 
     def convert(self, pef):
-        # Currently, PEF files aren't processed in chunks. Add this to the buffer which will be processed on completion
-        # Note: This may be changed in the future to do the more typical streaming conversion
-        self.pef_file.write(pef)
-        return b""
+        self.parser.feed(pef)
+        return self.convert_rows()
 
-    def read_pef_into(self, element, components):
-        for subelem in element:
-            if subelem.tag == pef_tag("row"):
-                if subelem.text is None:
-                    components.append("")
-                else:
-                    components.append(subelem.text)
+    def convert_rows(self):
+        "Convert the rows that have ended since the last call. Rows are separated by line breaks"
+        components = []
+        self.read_pef_events(self.parser.read_events(), components)
+        if len(components) == 0:
+            return b""
+        text = "\r\n".join(components)
+        if self.rows_written:
+            text = "\r\n" + text
+        self.rows_written = True
+        return self.unicode_encode(text)
 
-            else:
-                if subelem.tag not in [pef_tag("volume"), pef_tag("section"), pef_tag("page")]:
+    def read_pef_events(self, events, components):
+        """
+        Collect the text of rows from a stream of ("start", element) and ("end", element) parse events.
+        The document is walked in order, so warnings come in the order their elements appear.
+        Elements are cleared once they end, so only the ones still open are held in memory.
+        """
+        for event, element in events:
+            if event == "start":
+                self.depth += 1
+                if self.skip_depth is not None:
+                    # Inside a head, row, or ignored element
+                    continue
+                if self.depth == 1:
+                    if element.tag != PEF_TAG:
+                        self.warning("Unknown_element", f"The element {element.tag} is not the expected type <pef>. Parsing will continue, but this may not be a PEF file.")
+                elif self.depth == 2:
+                    if element.tag == HEAD_TAG:
+                        # Head tag contains meta elements, but we don't use them
+                        self.skip_depth = self.depth
+                    elif element.tag != BODY_TAG:
+                        self.warning("Unknown_element", f"The element {element.tag} is unknown and has been ignored.")
+                        self.skip_depth = self.depth
+                elif element.tag == ROW_TAG:
+                    # The row's text is read when it ends. Anything inside it is not
+                    self.skip_depth = self.depth
+                    self.in_row = True
+                elif element.tag not in CONTAINER_TAGS:
                     # Not a container element known to contain data, but we'll try it anyway
-                    self.warning("unexpected_element", f"The element {subelem.tag} is unknown.")
-                self.read_pef_into(subelem, components)
+                    self.warning("unexpected_element", f"The element {element.tag} is unknown.")
+            else:
+                if self.depth == self.skip_depth:
+                    if self.in_row:
+                        components.append("" if element.text is None else element.text)
+                        self.in_row = False
+                    self.skip_depth = None
+                element.clear()
+                self.depth -= 1
 
     def close(self):
-        # All conversion occurs here
-        self.pef_file.seek(0)
-        x = ElementTree.parse(self.pef_file)
-        unicode_components = []
-        r = x.getroot()
-        if r.tag != pef_tag("pef"):
-            self.warning("Unknown_element", f"The element {r.tag} is not the expected type <pef>. Parsing will continue, but this may not be a PEF file.")
-
-        for element in r:
-            if element.tag == pef_tag("head"):
-                # Head tag contains meta elements, but we don't use them
-                continue
-            elif element.tag == pef_tag("body"):
-                self.read_pef_into(element, unicode_components)
-            else:
-                self.warning("Unknown_element", f"The element {element.tag} is unknown and has been ignored.")
-        s= "\r\n".join(unicode_components).encode(self.output_encoding)
-        return s
+        self.parser.close()
+        self.closed = True
+        output = self.convert_rows()
+        if not self.rows_written:
+            # A document without rows still gets what encoding no text gives, such as a byte order mark
+            output = self.unicode_encode("")
+        return output
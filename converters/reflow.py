@@ -3,6 +3,10 @@ from .unicode import UnicodeConverter
 import re
 
 
+# A single line break between two other characters, which the double setting joins into a space
+single_linebreak_pattern = re.compile("([^\n\r])(\r?\n)([^\n\r])")
+
+
 class reflow (UnicodeConverter):
     name = "reflow"
     source_format = "unicode"
@@ -72,9 +76,11 @@ class reflow (UnicodeConverter):
         self.split_str = converter_options.get("split_character", "\u2824")
         self.linebreak_str = "\r\n"
         self.space_char = " "
+        self.single_linebreak_replacement = f"\\1{self.space_char}\\3"
         self.text_buffer = ""
 
     def close(self):
+        self.decode_final = True
         return self.convert(b"", closing=True)
 
     def convert(self, data, closing=False):
@@ -86,56 +92,58 @@ class reflow (UnicodeConverter):
             while i > 0 and self.text_buffer[i] in "\r\n":
                 i -= 1
             suffix = self.text_buffer[i:]
-            self.text_buffer = re.sub("([^\n\r])(\r?\n)([^\n\r])", f"\\1{self.space_char}\\3", self.text_buffer[0:i]) + suffix
+            self.text_buffer = single_linebreak_pattern.sub(self.single_linebreak_replacement, self.text_buffer[0:i]) + suffix
+        # The buffer is walked with a cursor rather than re-sliced after every line
+        buf = self.text_buffer
+        line_length = self.line_length
+        start = 0
         lines = []
-        while len(self.text_buffer) > self.line_length:
-            nli = -1
-            if "\n" in self.text_buffer:
-                nli = self.text_buffer.index("\n")
-            if "\r" in self.text_buffer:
-                cri = self.text_buffer.index("\r")
-                if cri < nli: nli = cri
-            if nli != -1 and nli < self.line_length:
+        while len(buf) - start > line_length:
+            limit = start + line_length
+            # Only a line break before the line length matters, so the searches stop there
+            # A \r counts when some \n follows it
+            nli = buf.find("\n", start, limit)
+            cri = buf.find("\r", start, limit if nli == -1 else nli)
+            if cri != -1 and (nli != -1 or buf.find("\n", cri) != -1):
+                nli = cri
+            if nli != -1:
                 # This line is already explicitly at size. Retain it
-                while nli < len(self.text_buffer) and self.text_buffer[nli] in "\r\n":
+                while nli < len(buf) and buf[nli] in "\r\n":
                     nli += 1
-                lines.append(self.text_buffer[0:nli])
-                self.text_buffer = self.text_buffer[nli:]
+                lines.append(buf[start:nli])
+                start = nli
                 continue
             # Time to split lines
             if self.word_wrap == "cut":
                 # slice off a chunk and start again
-                lines.append(self.text_buffer[0:self.line_length] + self.linebreak_str)
-                self.text_buffer = self.text_buffer[self.line_length:]
-            if self.word_wrap == "split":
-                if self.text_buffer[self.line_length] in self.blank_chars:
+                lines.append(buf[start:limit] + self.linebreak_str)
+                start = limit
+            elif self.word_wrap == "split":
+                if buf[limit] in self.blank_chars:
                     # No need to insert a split character
-                    lines.append(self.text_buffer[0:self.line_length] + self.linebreak_str)
-                    self.text_buffer = self.text_buffer[self.line_length:]
+                    lines.append(buf[start:limit] + self.linebreak_str)
+                    start = limit
                 else:
                     # Insert the split character
-                    ll = self.line_length - len(self.split_str)
-                    lines.append(self.text_buffer[0:ll] + self.split_str + self.linebreak_str)
-                    self.text_buffer = self.text_buffer[ll:]
-            if self.word_wrap == "wrap":
-                made_line = False
-                ci = self.line_length
-                while ci >= 0:
-                    if self.text_buffer[ci] in self.blank_chars:
-                        made_line = True
-                        break
-                    ci -= 1
-                if made_line:
-                    lines.append(self.text_buffer[0:ci] + self.linebreak_str)
-                    self.text_buffer = self.text_buffer[ci+1:]
+                    ll = start + line_length - len(self.split_str)
+                    lines.append(buf[start:ll] + self.split_str + self.linebreak_str)
+                    start = ll
+            elif self.word_wrap == "wrap":
+                # Wrap at the last blank character at or before the line length
+                ci = max(buf.rfind(c, start, limit + 1) for c in self.blank_chars)
+                if ci != -1:
+                    lines.append(buf[start:ci] + self.linebreak_str)
+                    start = ci + 1
                 else:
                     # Can't wrap this line. Split it instead
-                    ll = self.line_length - len(self.split_str)
-                    lines.append(self.text_buffer[0:ll] + self.split_str + self.linebreak_str)
-                    self.text_buffer = self.text_buffer[ll:]
+                    ll = start + line_length - len(self.split_str)
+                    lines.append(buf[start:ll] + self.split_str + self.linebreak_str)
+                    start = ll
         if closing:
             # Normally, retain any dangling chunk and attach next material
             # When closing, emit any dangling material
-            lines.append(self.text_buffer)
+            lines.append(buf[start:])
             self.text_buffer = ""
+        else:
+            self.text_buffer = buf[start:]
         return self.unicode_encode("".join(lines))
@@ -1,16 +1,47 @@
 # Converter to and from Unicode Braille characters in UTF-8
+import codecs
+import re
+import sys
 from .converter import converter, ConverterError
 
+# The encodings that can be used for Unicode Braille files, in the order they are tried when guessing
+unicode_encodings = ("UTF-8", "UTF-16", "UTF-32")
+# Byte order marks that identify an encoding by themselves
+# The little endian UTF-32 mark begins with the UTF-16 one, so the UTF-32 marks are checked first
+# The UTF-16 and UTF-32 codecs read either byte order from the mark
+byte_order_marks = (
+    (codecs.BOM_UTF32_LE, "UTF-32"),
+    (codecs.BOM_UTF32_BE, "UTF-32"),
+    (codecs.BOM_UTF16_LE, "UTF-16"),
+    (codecs.BOM_UTF16_BE, "UTF-16"),
+    (codecs.BOM_UTF8, "UTF-8")
+)
+# The marks that the UTF-16 and UTF-32 incremental decoders read the byte order from
+# Unlike bytes.decode, which uses the native byte order, they reject input that starts without one
+marked_encodings = {
+    "UTF-16": (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE),
+    "UTF-32": (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)
+}
+native_byte_order = "-LE" if sys.byteorder == "little" else "-BE"
+# The most bytes that are decoded to score an encoding when guessing
+ENCODING_SAMPLE_SIZE = 1 << 16
+# The most characters of each decoded sample that are scored when several encodings are valid
+PREDICTION_SAMPLE_SIZE = 4096
+
+# The UTF-8 encodings of the Unicode Braille characters begin with these
+unicode_braille_utf8_prefixes = (b"\xe2\xa0", b"\xe2\xa1", b"\xe2\xa2", b"\xe2\xa3")
+
 
 class UnicodeConverterError(ConverterError):
     """
     A subclass of converter error that deals specifically with Unicode encoding or decoding problems.
     """
-    def __init__(self, message, chain=[]):
+    def __init__(self, message, chain=()):
         """
         The message parameter is the expected string explaining what went wrong.
         The chain parameter can contain other exceptions to provide detail. Usually, these are instances of UnicodeDecodeError.
         """
+        ConverterError.__init__(self, message)
         self.chain = chain
 
 
@@ -43,6 +74,12 @@ class UnicodeConverter(converter):
                     "default": False
                 }
             ]
+        },
+        {
+            "name": "candidate_encodings",
+            "description": "The encodings, separated by commas, that may be chosen when the input encoding is determined automatically.",
+            "type": "str",
+            "default": ",".join(unicode_encodings)
         }
     ]
 
@@ -95,52 +132,85 @@ class UnicodeConverter(converter):
         }
     ]
 
+    # Values for the options above that are not given, merged with the given options once per converter
+    # A candidate_encodings of None means every Unicode encoding, without parsing a list
+    option_defaults = {
+        "input_encoding": "auto",
+        "candidate_encodings": None,
+        "output_encoding": "UTF-8"
+    }
+
     def __init__(self, generic_options={}, converter_options={}):
         converter.__init__(self, generic_options=generic_options, converter_options=converter_options)
-        input_encoding = converter_options.get("input_encoding", "auto")
+        options = {**self.option_defaults, **converter_options}
+        input_encoding = options["input_encoding"]
         self.auto_encoding = (input_encoding == "auto")
         self.input_encoding = input_encoding if input_encoding != "auto" else None
-        self.output_encoding = converter_options.get("output_encoding", "UTF-8")
+        candidate_encodings = options["candidate_encodings"]
+        if candidate_encodings is None:
+            self.candidate_encodings = unicode_encodings
+        else:
+            self.candidate_encodings = tuple(e.strip().upper() for e in candidate_encodings.split(",") if e.strip() != "")
+            for encoding in self.candidate_encodings:
+                if encoding not in unicode_encodings:
+                    raise ConverterError(f"Unknown candidate encoding {encoding}. Choose from {', '.join(unicode_encodings)}")
+            if len(self.candidate_encodings) == 0:
+                raise ConverterError("At least one candidate encoding is required")
+        self.output_encoding = options["output_encoding"]
         self.output_buffer = ""  # Only used for bidirectional converters
+        # Created once the input encoding is known. It holds on to incomplete characters between blocks
+        self.decoder = None
+        # Set by close, so that the last call to unicode_decode reports any incomplete character left at the end
+        self.decode_final = False
+        # Created on first use and kept, so a byte order mark is only written at the start of the output
+        self.encoder = None
 
     def close(self):
         """
         The default close function calls convert to clear out any unprocessed Unicode data
         If the child class uses other logic, this should be overridden.
         """
-        data = self.input_buffer
-        self.input_buffer = b""
+        data = bytes(self.input_buffer)
+        self.input_buffer.clear()
+        self.decode_final = True
         output = self.convert(data)
         self.closed = True
         return output
 
     def unicode_decode(self, data):
-        if data == b"":
-            return ""
-        if self.input_encoding:
-            all_data = self.input_buffer + data
-            try:
-                unicode_data = all_data.decode(encoding=self.input_encoding)
-                self.input_buffer = b""
-                return unicode_data
-            except UnicodeDecodeError as ude:
-                if ude.reason == "unexpected end of data" or ude.reason == "truncated data":
-                    if ude.start > 0:
-                        truncated_data = all_data[0:ude.start]
-                        try:
-                            truncated_unicode_data = truncated_data.decode(encoding=self.input_encoding)
-                            self.input_buffer = all_data[ude.start:]
-                            return truncated_unicode_data
-                        except UnicodeDecodeError as ude_second:
-                            raise UnicodeConverterError("Unicode decoding is consistently failing", [ude_second, ude])
-
-        elif self.auto_encoding:
-            # Guess the encoding
-            # Note: The encoding is guessed from the first chunk, then frozen
-            self.input_encoding = self.guess_encoding_of(data, self.count_unicode_braille_chars)
-            return self.unicode_decode(data)
-        else:
-            raise ConverterError("The input encoding is not set.")
+        # Text that has already been decoded, such as from another Unicode converter, is used as it is
+        if isinstance(data, str):
+            return data
+        if self.decoder is None:
+            self.input_buffer += data
+            if self.input_encoding is None:
+                if not self.auto_encoding:
+                    raise ConverterError("The input encoding is not set.")
+                # The input is held until there is a full sample to guess from, or no more is coming
+                # That way, the size of the blocks it arrives in never changes which encoding is chosen
+                if len(self.input_buffer) < ENCODING_SAMPLE_SIZE and not self.decode_final:
+                    return ""
+            data = bytes(self.input_buffer)
+            self.input_buffer.clear()
+            if data == b"":
+                return ""
+            if self.input_encoding is None:
+                # The encoding is then frozen for the rest of the input
+                self.input_encoding = self.guess_encoding_of(data, self.count_unicode_braille_chars, self.candidate_encodings)
+            decoder_encoding = self.input_encoding
+            marks = marked_encodings.get(decoder_encoding, ())
+            # Input without a byte order mark is decoded in the native byte order, as bytes.decode does
+            if marks and not data.startswith(marks):
+                if not self.decode_final and any(mark.startswith(data) for mark in marks):
+                    # Too short to tell whether it starts with a mark, so it is kept until more arrives
+                    self.input_buffer += data
+                    return ""
+                decoder_encoding += native_byte_order
+            self.decoder = codecs.getincrementaldecoder(decoder_encoding)()
+        try:
+            return self.decoder.decode(data, self.decode_final)
+        except UnicodeDecodeError as ude:
+            raise UnicodeConverterError(f"The input could not be decoded as {self.input_encoding}", [ude])
 
     @staticmethod
     def count_unicode_braille_chars(data):
@@ -148,17 +218,22 @@ class UnicodeConverter(converter):
         For use in encoding guessing.
         Returns the number of characters in a string between unicode 0x2800 and 0x2900
         """
-        r = 0
-        for c in data:
-            cn = ord(c)
-            if cn >= 0x2800 and cn < 0x2900:
-                r += 1
-        return r
+        # In UTF-8, every character from 0x2800 to 0x28ff starts with one of these pairs of bytes, and no other character contains them
+        # Counting them in the encoded string is done in C instead of looking at each character
+        encoded = data.encode("UTF-8", "surrogatepass")
+        return sum(encoded.count(prefix) for prefix in unicode_braille_utf8_prefixes)
 
     @staticmethod
-    def guess_encoding_of(data, content_prediction_function):
+    def guess_encoding_of(data, content_prediction_function, candidate_encodings=unicode_encodings):
+        # Encodings the user has ruled out are never chosen, even from a byte order mark
+        for bom, encoding in byte_order_marks:
+            if encoding in candidate_encodings and data.startswith(bom):
+                return encoding
+        # Only the start of the data is decoded. The chosen encoding decodes the rest later
+        # A character cut off at the end of the sample is handled like one cut off at the end of the data
+        data = data[0:ENCODING_SAMPLE_SIZE]
         candidates = []
-        for encoding in ["UTF-8", "UTF-16", "UTF-32"]:
+        for encoding in candidate_encodings:
             try:
                 text = data.decode(encoding=encoding)
                 candidates.append((encoding, text, None))
@@ -177,66 +252,110 @@ class UnicodeConverter(converter):
         elif len(options) == 0:
             raise ConverterError("Could not find a valid encoding")
         else:
-            return max(candidates, key=(lambda x: content_prediction_function(x[1])))[0]
+            # Each encoding that decoded the sample is scored once, and only on the start of its text
+            # The first of any equally scored encodings is chosen
+            valid = [c for c in candidates if c[2] is None]
+            scores = [content_prediction_function(text[0:PREDICTION_SAMPLE_SIZE]) for encoding, text, error in valid]
+            return valid[scores.index(max(scores))][0]
 
     def unicode_encode(self, cs):
+        if self.encoder is None:
+            encoding = self.output_encoding
+            if encoding == "match":
+                encoding = self.input_encoding
+                if encoding is None:
+                    if not self.decode_final:
+                        # Nothing has been decoded yet, so hold on to the text until the input encoding is known
+                        self.output_buffer += cs
+                        return b""
+                    # Only text that was already decoded was given, so there is no encoding to match
+                    encoding = UnicodeConverter.option_defaults["output_encoding"]
+            self.encoder = codecs.getincrementalencoder(encoding)()
         if self.output_buffer != "":
             cs = self.output_buffer + cs
             self.output_buffer = ""
-        if self.output_encoding == "match":
-            if self.input_encoding != "auto":
-                return cs.encode(self.input_encoding)
-            else:
-                self.output_buffer = cs
-        else:
-            return cs.encode(self.output_encoding)
+        return self.encoder.encode(cs)
 
 
 # Generic converter for 8-dot single-byte Braille formats
 
 
+# Characters that are neither in the one-byte range nor Unicode Braille
+out_of_range_pattern = re.compile("[^\x00-\xff\u2800-\u28ff]")
+
+
 class unicode_to_generic8dot (UnicodeConverter):
     source_format = "unicode"
     options = UnicodeConverter.input_options
 
+    def __init__(self, generic_options={}, converter_options={}):
+        UnicodeConverter.__init__(self, generic_options, converter_options)
+        # Characters in the one-byte range are not in the table, so they are emitted directly into the file
+        # Braille characters map to the latin-1 character for their byte, and unencodable ones become spaces
+        self.encode_table = {0x2800 + i: chr(c) for i, c in enumerate(self.table_bytes)}
+        for c in self.unencodable_chars:
+            self.encode_table[ord(c)] = " "
+        # Every character that gets a warning, so that one pass over the text finds both kinds
+        if self.unencodable_chars:
+            self.warning_pattern = re.compile(out_of_range_pattern.pattern + "|[" + re.escape("".join(self.unencodable_chars)) + "]")
+        else:
+            self.warning_pattern = out_of_range_pattern
+
     def convert(self, unicode):
-        output = b""
-        for c in self.unicode_decode(unicode):
-            cn = ord(c)
-            if cn < 256:
-                # characters in one-byte range are emitted directly into the file
-                output += bytes([cn])
-            elif cn < 0x2800 or cn >= 0x2900:
-                self.warning("character_out_of_range", f"The character {c} cannot be directly converted to {self.output_format} format.")
-            elif c in self.unencodable_chars.keys():
-                self.warning("character_unsupported", f"The character {unencodable_chars[c]} cannot be directly converted to {self.output_format} format.")
-                output += b" "
+        text = self.unicode_decode(unicode)
+        out_of_range = []
+        unsupported = []
+        for c in self.warning_pattern.findall(text):
+            if c in self.unencodable_chars:
+                unsupported.append(self.unencodable_chars[c])
             else:
-                output += bytes([self.table_bytes[cn - 0x2800]])
-        return output
+                out_of_range.append(c)
+        if out_of_range:
+            self.character_warning("character_out_of_range", out_of_range,
+                f"The character {out_of_range[0]} cannot be directly converted to {self.output_format} format.",
+                f"characters cannot be directly converted to {self.output_format} format")
+            text = out_of_range_pattern.sub("", text)
+        if unsupported:
+            self.character_warning("character_unsupported", unsupported,
+                f"The character {unsupported[0]} cannot be directly converted to {self.output_format} format.",
+                f"characters cannot be directly converted to {self.output_format} format")
+        return text.translate(self.encode_table).encode("latin-1")
+
+
+def make_decode_table(table_bytes, directly_used_bytes):
+    """
+    Build the str.translate table for an 8-dot format, for use on data decoded as latin-1.
+    Returns the table and the bytes that may appear in the format's files.
+    Where a byte appears more than once in table_bytes, its first position is used.
+    Directly used bytes are left out of the table, so they pass through unchanged.
+    """
+    table = {}
+    for i, c in enumerate(table_bytes):
+        table.setdefault(c, chr(0x2800 + i))
+    for c in directly_used_bytes:
+        table.pop(c, None)
+    known_bytes = bytes(sorted(set(table_bytes) | set(directly_used_bytes)))
+    return (table, known_bytes)
 
 
 class generic8dot_to_unicode (UnicodeConverter):
     output_format = "unicode"
     options = UnicodeConverter.output_options
 
-    def convert(self, input):
-        unicode_blocks = []
-        unicode = ""
-        for chunk in input.split(b"\r\n"):
-            for c in chunk:
-                if c in self.directly_used_bytes:
-                    unicode += chr(c)
-                elif c in self.table_bytes:
-                    unicode += chr(0x2800 + self.table_bytes.index(c))
-                    print(f"Finding character {c}: {self.table_bytes.index(c)}")
-                else:
-                    self.warning("unexpected_character", f"The character {c} is not expected in this file.")
-                    unicode += chr(c)
-            unicode_blocks.append(unicode)
-            unicode = ""
+    def __init__(self, generic_options={}, converter_options={}):
+        UnicodeConverter.__init__(self, generic_options, converter_options)
+        self.decode_table, self.known_bytes = make_decode_table(self.table_bytes, self.directly_used_bytes)
 
-        return ("\r\n".join(unicode_blocks)).encode(self.output_encoding)
+    def convert(self, input):
+        # \r\n line breaks always pass through, even when \r or \n alone stands for a Braille character
+        # Deleting every expected byte leaves just the unexpected ones, in the order they appear
+        unexpected = list(input.replace(b"\r\n", b"").translate(None, self.known_bytes))
+        if unexpected:
+            self.character_warning("unexpected_character", unexpected,
+                f"The character {unexpected[0]} is not expected in this file.",
+                "characters are not expected in this file")
+        unicode_blocks = [chunk.decode("latin-1").translate(self.decode_table) for chunk in input.split(b"\r\n")]
+        return self.unicode_encode("\r\n".join(unicode_blocks))
 
     def close(self):
         # The input buffer is not used. Skip unicode_converter version
@@ -0,0 +1,87 @@
+# Tests that run brl2brf.py as a command, the way users run it
+# Run with: python -m unittest discover tests
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "brl2brf.py")
+
+
+def run_brl2brf(*args, input_data=None):
+    """
+    Runs brl2brf.py with the given arguments and returns the completed process.
+    Output is captured as bytes.
+    """
+    return subprocess.run([sys.executable, SCRIPT, *args], input=input_data, capture_output=True)
+
+
+class encoding_detection_tests (unittest.TestCase):
+    """
+    The encoding of Unicode input must not depend on how the input is split into blocks.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_input(self, data):
+        path = os.path.join(self.directory.name, "input.txt")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_utf32_byte_order_mark_with_small_blocks(self):
+        # The UTF-32 byte order marks begin with the UTF-16 ones, so a block of fewer than 4 bytes cannot tell them apart
+        text = "⠁⠃⠉ ⠙⠑\r\n⠋⠛"
+        for encoding in ["UTF-32-LE", "UTF-32-BE"]:
+            mark = "﻿".encode(encoding)
+            path = self.write_input(mark + text.encode(encoding))
+            for block_size in ["1", "2", "3"]:
+                with self.subTest(encoding=encoding, block_size=block_size):
+                    result = run_brl2brf("-f", path, "-sf", "unicode", "-of", "brf", "-o", "-bs", block_size)
+                    self.assertEqual(result.returncode, 0, result.stderr)
+                    self.assertEqual(result.stdout, b"ABC DE\r\nFG")
+
+
+class block_size_tests (unittest.TestCase):
+    """
+    Converting the same input with different --block-size values gives the same output.
+    """
+
+    block_sizes = ["1", "2", "3", "7", "4096", "65535", "1048576"]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def assert_same_output_for_block_sizes(self, data, *args):
+        path = os.path.join(self.directory.name, "input")
+        with open(path, "wb") as f:
+            f.write(data)
+        outputs = {}
+        for block_size in self.block_sizes:
+            result = run_brl2brf("-f", path, "-o", "--warnings", "ignore", "-bs", block_size, *args)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            outputs[block_size] = result.stdout
+        for block_size in self.block_sizes[1:]:
+            with self.subTest(block_size=block_size):
+                self.assertEqual(outputs[block_size], outputs[self.block_sizes[0]])
+
+    def test_unicode_to_brf(self):
+        # More text than the encoding detection sample, with 8 dot characters and line breaks
+        text = "".join(chr(0x2800 + (i * 37) % 256) + ("\r\n" if i % 29 == 0 else "") for i in range(30000))
+        for encoding in ["UTF-8", "UTF-16", "UTF-32-LE"]:
+            with self.subTest(encoding=encoding):
+                self.assert_same_output_for_block_sizes(text.encode(encoding), "-sf", "unicode", "-of", "brf")
+
+    def test_brf_to_unicode(self):
+        data = b"".join(bytes([0x20 + (i * 7) % 64]) + (b"\r\n" if i % 31 == 0 else b"") for i in range(20000))
+        for output_format in ["unicode", "brl", "helptech"]:
+            with self.subTest(output_format=output_format):
+                self.assert_same_output_for_block_sizes(data, "-sf", "brf", "-of", output_format)
+
+
+if __name__ == "__main__":
+    unittest.main()